@@ -1,9 +1,47 @@
-import random
+import threading
 import time
-from typing import List
+from random import shuffle as _shuffle
+from time import sleep as _sleep, time_ns as _time_ns
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class _BitLayout(NamedTuple):
+    max_process_id: int
+    max_worker_id: int
+    max_increment_id: int
+    worker_id_left_shift: int
+    process_id_left_shift: int
+    timestamp_left_shift: int
+
+
+@lru_cache(maxsize=None)
+def _bit_layout(process_id_bits, worker_id_bits, increment_bits) -> _BitLayout:
+    # Generators with the same bit widths share one layout, which workers read their constants from.
+    worker_id_left_shift = increment_bits
+    process_id_left_shift = worker_id_bits + worker_id_left_shift
+    return _BitLayout(max_process_id=-1 ^ (-1 << process_id_bits),
+                      max_worker_id=-1 ^ (-1 << worker_id_bits),
+                      max_increment_id=-1 ^ (-1 << increment_bits),
+                      worker_id_left_shift=worker_id_left_shift,
+                      process_id_left_shift=process_id_left_shift,
+                      timestamp_left_shift=process_id_bits + process_id_left_shift)
+
+
+class TimeRunningBackwardsError(OSError):
+    # The message is only formatted when it is shown, keeping the check in get_next_id cheap.
+    def __init__(self, milliseconds):
+        super().__init__(milliseconds)
+        self.milliseconds = milliseconds
+
+    def __str__(self):
+        return "Time running backwards, not generating ids till %d milliseconds." % self.milliseconds
 
 
 class IDProcessWorker:
+    __slots__ = ('worker_id', 'process_id', 'epoch', 'id_gen', 'last_timestamp', 'increment',
+                 '_max_inc', '_ts_shift', '_pw_or', '_base', '_strict_clock')
+
     def __init__(self, worker_id, process_id, epoch, id_gen: 'IDGenerator', increment=0):
         self.worker_id = worker_id
         self.process_id = process_id
@@ -11,81 +49,224 @@ class IDProcessWorker:
         self.id_gen = id_gen
         self.last_timestamp = -1
         self.increment = increment
-        self.timestamp = self.current_time()
+        # Constant per worker, so they are computed once instead of on every ID.
+        layout = id_gen._layout
+        self._max_inc = layout.max_increment_id
+        self._ts_shift = layout.timestamp_left_shift
+        self._pw_or = (process_id << layout.process_id_left_shift) | (worker_id << layout.worker_id_left_shift)
+        self._strict_clock = id_gen.strict_clock
+        # ID bits above the increment for last_timestamp, reused while the millisecond lasts.
+        self._base = 0
 
     def get_next_id(self) -> int:
-        timestamp = self.current_time()
-        if timestamp < self.last_timestamp:
-            raise OSError("Time running backwards, not generating ids till %d milliseconds." % (self.last_timestamp - timestamp))
+        timestamp = _time_ns() // 1_000_000
+        last_timestamp = self.last_timestamp
+        if timestamp < last_timestamp:
+            if self._strict_clock:
+                raise TimeRunningBackwardsError(last_timestamp - timestamp)
+            # Hold on to the last millisecond until the clock catches up again.
+            timestamp = last_timestamp
+        if timestamp == last_timestamp:
+            increment = (self.increment + 1) & self._max_inc
+            if increment:
+                self.increment = increment
+                return self._base | increment
+            # Every increment of this millisecond is used up, wait for the next one.
+            timestamp = self.next_milliseconds(last_timestamp)
 
-        self.increment = (self.increment + 1) & self.id_gen.max_increment_id
+        # A new worker carries on from the increment it was created with, later milliseconds start at 0.
+        increment = (self.increment + 1) & self._max_inc if last_timestamp < 0 else 0
+        self.increment = increment
         self.last_timestamp = timestamp
+        base = ((timestamp - self.epoch) << self._ts_shift) | self._pw_or
+        self._base = base
+        return base | increment
+
+    def get_next_ids(self, count) -> List[int]:
+        ids: List[int] = []
+        while count > 0:
+            base, start, stop = self._reserve(count)
+            # The increment occupies the lowest bits, so a run of increments is a run of consecutive IDs.
+            ids.extend(range(base + start, base + stop))
+            count -= stop - start
+        return ids
 
-        return int(((timestamp - self.epoch) << self.id_gen.timestamp_left_shift)
-                   | (self.process_id << self.id_gen.process_id_left_shift)
-                   | (self.worker_id << self.id_gen.worker_id_left_shift)
-                   | self.increment)
+    def _reserve(self, count) -> Tuple[int, int, int]:
+        # Take up to count increments of the current millisecond, as (base, start, stop).
+        timestamp = _time_ns() // 1_000_000
+        last_timestamp = self.last_timestamp
+        if timestamp < last_timestamp:
+            if self._strict_clock:
+                raise TimeRunningBackwardsError(last_timestamp - timestamp)
+            timestamp = last_timestamp
+
+        if timestamp == last_timestamp:
+            start = self.increment + 1
+            if start > self._max_inc:
+                timestamp = self.next_milliseconds(last_timestamp)
+                start = 0
+        elif last_timestamp < 0:
+            start = (self.increment + 1) & self._max_inc
+        else:
+            start = 0
+        stop = min(start + count, self._max_inc + 1)
+        base = ((timestamp - self.epoch) << self._ts_shift) | self._pw_or
+        self._base = base
+        self.increment = stop - 1
+        self.last_timestamp = timestamp
+        return base, start, stop
 
     def next_milliseconds(self, last_timestamp) -> int:
-        timestamp = self.current_time()
-        while timestamp <= last_timestamp:
-            timestamp = self.current_time()
-        return timestamp
+        now = _time_ns()
+        while now // 1_000_000 <= last_timestamp:
+            # Sleep until the millisecond after last_timestamp starts, instead of spinning on the clock.
+            _sleep(((last_timestamp + 1) * 1_000_000 - now) / 1e9)
+            now = _time_ns()
+        return now // 1_000_000
 
     @staticmethod
     def current_time():
-        return int(time.time() * 1000.0)
+        return _time_ns() // 1_000_000
+
+
+class _IncrementBlock(threading.local):
+    # The run of increments a thread has reserved from a worker, valid for one millisecond.
+    def __init__(self):
+        self.timestamp = -1
+        self.base = 0
+        self.next = 0
+        self.stop = 0
+
+
+class ThreadSafeIDProcessWorker(IDProcessWorker):
+    # Threads take increments from the shared counter a block at a time under the lock,
+    # then hand out the block's IDs from their own thread-local copy without locking.
+    __slots__ = ('_block_size', '_block', '_lock')
+
+    def __init__(self, worker_id, process_id, epoch, id_gen: 'IDGenerator', increment=0):
+        super().__init__(worker_id, process_id, epoch, id_gen, increment)
+        self._block_size = 1 << min(id_gen.local_increment_bits, id_gen.increment_bits)
+        self._block = _IncrementBlock()
+        self._lock = threading.Lock()
+
+    def get_next_id(self) -> int:
+        block = self._block
+        if _time_ns() // 1_000_000 == block.timestamp:
+            increment = block.next
+            if increment < block.stop:
+                block.next = increment + 1
+                return block.base | increment
+
+        with self._lock:
+            base, start, stop = IDProcessWorker._reserve(self, self._block_size)
+            block.timestamp = self.last_timestamp
+        block.base = base
+        block.next = start + 1
+        block.stop = stop
+        return base | start
+
+    def _reserve(self, count) -> Tuple[int, int, int]:
+        with self._lock:
+            return super()._reserve(count)
 
 
 class IDGenerator:
-    def __init__(self, epoch: int, process_id_bits=5, worker_id_bits=5, increment_bits=12, random_worker=True):
+    __slots__ = ('process_id_bits', 'worker_id_bits', 'increment_bits', '_layout',
+                 'max_process_id', 'max_increment_id', 'max_worker_id',
+                 'worker_id_left_shift', 'process_id_left_shift', 'timestamp_left_shift', 'epoch', 'strict_clock',
+                 'thread_safe', 'local_increment_bits',
+                 'workers_full', '_worker_index', '_n_workers', 'random_worker', 'create_id')
+
+    def __init__(self, epoch: int, process_id_bits=5, worker_id_bits=5, increment_bits=12, random_worker=True,
+                 strict_clock=True, thread_safe=False, local_increment_bits=8):
         # ID bits
         self.process_id_bits = process_id_bits
         self.worker_id_bits = worker_id_bits
         self.increment_bits = increment_bits
+        self._layout = _bit_layout(process_id_bits, worker_id_bits, increment_bits)
         # Max ids
-        self.max_process_id = -1 ^ (-1 << self.process_id_bits)
-        self.max_increment_id = -1 ^ (-1 << self.increment_bits)
-        self.max_worker_id = -1 ^ (-1 << self.worker_id_bits)
+        self.max_process_id = self._layout.max_process_id
+        self.max_increment_id = self._layout.max_increment_id
+        self.max_worker_id = self._layout.max_worker_id
 
         # Left shifts
-        self.worker_id_left_shift = self.increment_bits
-        self.process_id_left_shift = self.worker_id_bits + self.worker_id_left_shift
-        self.timestamp_left_shift = self.process_id_bits + self.process_id_left_shift
+        self.worker_id_left_shift = self._layout.worker_id_left_shift
+        self.process_id_left_shift = self._layout.process_id_left_shift
+        self.timestamp_left_shift = self._layout.timestamp_left_shift
         self.epoch = epoch
+        # When False, a clock that goes backwards keeps stamping IDs with the last millisecond instead of raising.
+        self.strict_clock = strict_clock
+        # Thread safe workers reserve 1 << local_increment_bits increments per thread at a time.
+        self.thread_safe = thread_safe
+        self.local_increment_bits = local_increment_bits
 
-        self.workers: List['IDProcessWorker'] = []
         self.workers_full: List['IDProcessWorker'] = []
+        self._worker_index: Dict[Tuple[int, int], 'IDProcessWorker'] = {}
+        self._n_workers = 0
         self.random_worker = random_worker
-        if not self.random_worker:
-            self.serial_worker_index = 0
+        self.create_id = self._build_create_id()
 
     def create_process_and_worker(self, worker_id, process_id, increment=0) -> 'IDProcessWorker':
-        worker = IDProcessWorker(worker_id, process_id, self.epoch, self, increment)
-        self.workers.append(worker)
+        worker_class = ThreadSafeIDProcessWorker if self.thread_safe else IDProcessWorker
+        worker = worker_class(worker_id, process_id, self.epoch, self, increment)
         self.workers_full.append(worker)
+        # Keep the first worker for a pair, like the previous lookup over workers_full did.
+        self._worker_index.setdefault((worker_id, process_id), worker)
+        self._n_workers = len(self.workers_full)
+        self.create_id = self._build_create_id()
         return worker
 
-    def create_id(self) -> int:
+    def _build_create_id(self) -> Callable[[], int]:
+        # create_id is rebuilt when a worker is added. It closes over the worker count and the
+        # workers' bound get_next_id methods, so a call makes no attribute lookups on self.
+        get_next_ids = [worker.get_next_id for worker in self.workers_full]
+        n_workers = len(get_next_ids)
+        index = 0
+
         if self.random_worker:
-            random.shuffle(self.workers)
-            random_worker = self.workers.pop(0)
-            if not self.workers:
-                self.workers = self.workers_full.copy()
-            return random_worker.get_next_id()
+            # Walk a shuffled list of the workers and reshuffle it in place after each pass,
+            # so every worker is used once per pass in a random order without copying the list.
+            _shuffle(get_next_ids)
+
+            def create_id() -> int:
+                nonlocal index
+                # Work on a local copy so that index, which threads share, never holds n_workers.
+                current = index
+                next_index = current + 1
+                if next_index == n_workers:
+                    _shuffle(get_next_ids)
+                    next_index = 0
+                index = next_index
+                return get_next_ids[current]()
         else:
-            serial_worker = self.workers_full[self.serial_worker_index]
-            self.serial_worker_index %= len(self.workers_full)
-            serial_worker.get_next_id()
+            def create_id() -> int:
+                nonlocal index
+                current = index
+                next_index = current + 1
+                index = next_index if next_index < n_workers else 0
+                return get_next_ids[current]()
 
-    def get_worker(self, worker_id, process_id) -> 'IDProcessWorker':
-        for worker in self.workers_full:
-            if worker.worker_id == worker_id and worker.process_id == process_id:
-                return worker
+        return create_id
+
+    def create_ids(self, count) -> List[int]:
+        if count <= 0:
+            return []
+        if not self._n_workers:
+            raise ValueError("No workers to create IDs with, add one with create_process_and_worker first.")
+        # Every worker has its own increments, so spreading the batch lets each one fill whole milliseconds.
+        share, extra = divmod(count, self._n_workers)
+        ids: List[int] = []
+        for index, worker in enumerate(self.workers_full):
+            ids.extend(worker.get_next_ids(share + (index < extra)))
+        return ids
+
+    def get_worker(self, worker_id, process_id) -> Optional['IDProcessWorker']:
+        return self._worker_index.get((worker_id, process_id))
 
 
 if __name__ == '__main__':
     import datetime
+    from array import array
 
     EPOCH = 1577836800  # 1st Jan 2020
 
@@ -109,3 +290,11 @@ if __name__ == '__main__':
     print("Process ID:", (starting_id & 0x3E0000) >> 17)
     print("Worker ID:", (starting_id & 0x1F000) >> 12)
     print("Increment:", (starting_id & 0xFFF))
+
+    # Create 100000 IDs into a preallocated array of 64 bit integers, instead of growing a list of int objects.
+    id_array = array('q', bytes(8 * 100000))
+    start_time = time.perf_counter()
+    for j in range(100000):
+        id_array[j] = id_gen_1.create_id()
+    print("Created %d IDs in %.3f seconds" % (len(id_array), time.perf_counter() - start_time))
+    print("Unique IDs:", len(set(id_array)))
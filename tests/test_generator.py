@@ -0,0 +1,145 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from id_generator.generator import IDGenerator
+
+EPOCH = 1577836800
+
+
+def frozen_clock(milliseconds):
+    # Pin the generator's clock to a single millisecond.
+    return mock.patch('id_generator.generator._time_ns', return_value=milliseconds * 1_000_000)
+
+
+def worker_id_of(generated_id, id_gen):
+    return (generated_id >> id_gen.worker_id_left_shift) & id_gen.max_worker_id
+
+
+class SerialWorkerTest(unittest.TestCase):
+    def test_create_id_cycles_through_workers(self):
+        id_gen = IDGenerator(EPOCH, random_worker=False)
+        for worker_id in range(3):
+            id_gen.create_process_and_worker(worker_id, 0)
+
+        ids = [id_gen.create_id() for _ in range(7)]
+        self.assertNotIn(None, ids)
+        self.assertEqual([worker_id_of(i, id_gen) for i in ids], [0, 1, 2, 0, 1, 2, 0])
+
+
+class StartingIncrementTest(unittest.TestCase):
+    def test_first_id_continues_from_starting_increment(self):
+        for thread_safe in (False, True):
+            id_gen = IDGenerator(EPOCH, thread_safe=thread_safe)
+            worker = id_gen.create_process_and_worker(1, 1, increment=100)
+            with frozen_clock(time.time_ns() // 1_000_000):
+                self.assertEqual(worker.get_next_id() & id_gen.max_increment_id, 101)
+                self.assertEqual(worker.get_next_id() & id_gen.max_increment_id, 102)
+
+    def test_first_batch_continues_from_starting_increment(self):
+        id_gen = IDGenerator(EPOCH)
+        worker = id_gen.create_process_and_worker(1, 1, increment=100)
+        self.assertEqual(worker.get_next_ids(1)[0] & id_gen.max_increment_id, 101)
+
+
+class CreateIdsTest(unittest.TestCase):
+    def test_unique_across_millisecond_rollover(self):
+        id_gen = IDGenerator(EPOCH, increment_bits=3)
+        id_gen.create_process_and_worker(0, 0)
+        id_gen.create_process_and_worker(1, 0)
+
+        # Each worker's share is larger than one millisecond's increments.
+        ids = id_gen.create_ids(100)
+        self.assertEqual(len(ids), 100)
+        self.assertEqual(len(set(ids)), 100)
+
+    def test_mixed_with_create_id(self):
+        id_gen = IDGenerator(EPOCH, increment_bits=4)
+        for worker_id in range(3):
+            id_gen.create_process_and_worker(worker_id, 0)
+
+        ids = []
+        for _ in range(20):
+            ids.extend(id_gen.create_ids(25))
+            ids.extend(id_gen.create_id() for _ in range(10))
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_empty_batch(self):
+        id_gen = IDGenerator(EPOCH)
+        self.assertEqual(id_gen.create_ids(0), [])
+
+    def test_no_workers(self):
+        id_gen = IDGenerator(EPOCH)
+        with self.assertRaises(ValueError):
+            id_gen.create_ids(1)
+
+
+class ThreadSafeWorkerTest(unittest.TestCase):
+    def test_unique_across_threads(self):
+        # Small blocks and increments make threads contend for blocks and milliseconds.
+        id_gen = IDGenerator(EPOCH, increment_bits=6, local_increment_bits=2, thread_safe=True)
+        id_gen.create_process_and_worker(0, 0)
+        id_gen.create_process_and_worker(1, 0)
+        results = []
+
+        def create():
+            results.append([id_gen.create_id() for _ in range(2000)])
+
+        threads = [threading.Thread(target=create) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        ids = [generated_id for thread_ids in results for generated_id in thread_ids]
+        self.assertEqual(len(ids), 8 * 2000)
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_create_ids_mixed_across_threads(self):
+        id_gen = IDGenerator(EPOCH, increment_bits=6, local_increment_bits=2, thread_safe=True)
+        id_gen.create_process_and_worker(0, 0)
+        results = []
+
+        def create():
+            ids = []
+            for _ in range(20):
+                ids.extend(id_gen.create_ids(30))
+                ids.extend(id_gen.create_id() for _ in range(30))
+            results.append(ids)
+
+        threads = [threading.Thread(target=create) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        ids = [generated_id for thread_ids in results for generated_id in thread_ids]
+        self.assertEqual(len(ids), 4 * 20 * 60)
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_clamped_clock_keeps_block(self):
+        id_gen = IDGenerator(EPOCH, strict_clock=False, thread_safe=True)
+        worker = id_gen.create_process_and_worker(0, 0)
+        now = time.time_ns() // 1_000_000
+        with frozen_clock(now):
+            first_id = worker.get_next_id()
+        with frozen_clock(now - 3):
+            ids = [worker.get_next_id() for _ in range(1000)]
+
+        # The clock is behind, so the increments carry on within the last millisecond.
+        self.assertEqual([i & id_gen.max_increment_id for i in ids], list(range(2, 1002)))
+        self.assertEqual({i >> id_gen.timestamp_left_shift for i in ids}, {first_id >> id_gen.timestamp_left_shift})
+
+    def test_strict_clock_raises(self):
+        id_gen = IDGenerator(EPOCH, thread_safe=True)
+        worker = id_gen.create_process_and_worker(0, 0)
+        now = time.time_ns() // 1_000_000
+        with frozen_clock(now):
+            worker.get_next_id()
+        with frozen_clock(now - 3), self.assertRaises(OSError):
+            worker.get_next_id()
+
+
+if __name__ == '__main__':
+    unittest.main()